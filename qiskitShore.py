@@ -1,14 +1,101 @@
+from functools import lru_cache
+
+from qiskit import transpile
+from qiskit.exceptions import QiskitError
 from qiskit_algorithms import Shor
 from qiskit_aer import AerSimulator
+from qiskit_aer.primitives import Sampler as AerSampler
 from qiskit.primitives import Sampler
 
-def factor_with_shors(n, max_attempts=10):
+from simulShore import _is_prime
+
+# Backend objects are expensive to set up, so they are created on first use
+# and shared by every factor_with_shors call in the process, one per device
+_SIMULATORS = {}
+_SAMPLERS = {}
+
+def _select_device(use_gpu):
+    """
+    Return "GPU" if it was requested and Aer can see a CUDA device,
+    otherwise "CPU".
+    """
+    if use_gpu:
+        if "GPU" in _get_simulator("CPU").available_devices():
+            return "GPU"
+        print("GPU simulation unavailable, falling back to CPU\n")
+    return "CPU"
+
+def _get_simulator(device):
+    """
+    Return the shared statevector AerSimulator for device, creating it on
+    first use.
+    """
+    if device not in _SIMULATORS:
+        _SIMULATORS[device] = AerSimulator(method="statevector", device=device)
+    return _SIMULATORS[device]
+
+def _get_sampler(device="CPU"):
+    """
+    Return the shared Sampler primitive for device, creating it on first
+    use. GPU runs need Aer's own Sampler so the circuits execute on the
+    GPU; it is handed circuits already transpiled by _transpiled_circuit.
+    """
+    if device not in _SAMPLERS:
+        if device == "CPU":
+            _SAMPLERS[device] = Sampler()
+        else:
+            _SAMPLERS[device] = AerSampler(
+                backend_options={"method": "statevector", "device": device},
+                skip_transpilation=True,
+            )
+    return _SAMPLERS[device]
+
+# How many built Shor circuits to keep; each is a whole modular
+# exponentiation circuit, so the cache is kept small
+_CIRCUIT_CACHE_SIZE = 16
+
+@lru_cache(maxsize=_CIRCUIT_CACHE_SIZE)
+def _build_circuit(N, a, measurement):
+    """
+    Build the Shor circuit for N and base a; recent circuits stay cached.
+    """
+    return Shor().construct_circuit(N=N, a=a, measurement=measurement)
+
+@lru_cache(maxsize=_CIRCUIT_CACHE_SIZE)
+def _transpiled_circuit(N, a, measurement, device):
+    """
+    The Shor circuit for N and base a, transpiled once for the Aer
+    simulator on device; recent circuits stay cached.
+    """
+    return transpile(
+        _build_circuit(N, a, measurement), _get_simulator(device), optimization_level=3
+    )
+
+class _CachedShor(Shor):
+    """
+    Shor's algorithm that reuses recently built circuits.
+    """
+    
+    def __init__(self, sampler=None, device="CPU"):
+        super().__init__(sampler=sampler)
+        self._device = device
+    
+    def construct_circuit(self, N, a=2, measurement=False):
+        # The reference Sampler runs circuits as built; only Aer needs them
+        # transpiled for its backend
+        if self._device == "CPU":
+            return _build_circuit(N, a, measurement)
+        return _transpiled_circuit(N, a, measurement, self._device)
+
+def factor_with_shors(n, max_attempts=10, use_gpu=False):
     """
     Use Shor's algorithm to factor a number.
     
     Args:
-        n: The number to factor
+        n: The number to factor (must be composite and odd)
         max_attempts: Maximum number of attempts to find a factor
+        use_gpu: Simulate on a CUDA GPU (needs qiskit-aer-gpu); falls back
+            to the CPU if no GPU is available
     
     Returns:
         A tuple of factors (a, b) where n = a * b, or None if unsuccessful
@@ -18,38 +105,41 @@ def factor_with_shors(n, max_attempts=10):
     print("=" * 60)
     print(f"Attempting to factor: {n}\n")
     
-    # Create a simulator backend
-    simulator = AerSimulator()
+    # Shor's algorithm only applies to odd composites; reject anything else
+    # before setting up a backend
+    if n < 4 or n % 2 == 0 or _is_prime(n):
+        print(f"✗ {n} is not an odd composite number")
+        return None
     
-    # Create a Sampler primitive for measurement
-    sampler = Sampler()
+    # Pick the device and reuse its Sampler primitive for measurement
+    device = _select_device(use_gpu)
+    sampler = _get_sampler(device)
     
-    # Create the Shor's algorithm instance
-    shor = Shor(sampler=sampler)
+    # Create the Shor's algorithm instance, sharing the circuit cache
+    shor = _CachedShor(sampler=sampler, device=device)
     
     # Run Shor's algorithm
     try:
         result = shor.factor(N=n, a_start=2, a_step=1, max_attempts=max_attempts)
-        
-        print("Results:")
-        print(f"  Input number: {result.N}")
-        print(f"  Factors found: {result.factors}")
-        print(f"  Distinct factors: {result.distinct_factors}")
-        
-        if result.factors:
-            # Get the factors
-            factors = result.factors[0]  # factors is a list of lists
-            print(f"\n✓ Successfully factored {n}:")
-            print(f"  {n} = {factors[0]} × {factors[1]}")
-            print(f"  Verification: {factors[0]} × {factors[1]} = {factors[0] * factors[1]}")
-            return tuple(factors)
-        else:
-            print("\n✗ No factors found")
-            return None
-            
-    except Exception as e:
+    except QiskitError as e:
         print(f"Error during factorization: {e}")
         return None
+    
+    print("Results:")
+    print(f"  Input number: {result.N}")
+    print(f"  Factors found: {result.factors}")
+    print(f"  Distinct factors: {result.distinct_factors}")
+    
+    if result.factors:
+        # Get the factors
+        factors = result.factors[0]  # factors is a list of lists
+        print(f"\n✓ Successfully factored {n}:")
+        print(f"  {n} = {factors[0]} × {factors[1]}")
+        print(f"  Verification: {factors[0]} × {factors[1]} = {factors[0] * factors[1]}")
+        return tuple(factors)
+    else:
+        print("\n✗ No factors found")
+        return None
 
 def main():
     """
@@ -1,32 +1,255 @@
 import math
 import random
+import sys
+from itertools import islice
 from math import gcd
 
-def find_order(a, n, max_order=None):
+try:
+    import gmpy2
+except ImportError:
+    gmpy2 = None
+
+# Up to this modulus a plain scan over a^1, a^2, ... finds the order faster
+# than building the baby-step table
+_SMALL_N_MAX = 256
+
+# Most entries the baby-step table in find_order may hold (about 30 MB);
+# past this the giant steps take up the slack instead of memory
+_BSGS_MAX_BABY_STEPS = 1 << 18
+
+# Modular powers with moduli wider than a machine word go through GMP,
+# whose multiply and reduce beat CPython's generic bigint routines
+_MACHINE_WORD_BITS = 64
+
+# From this size on gcds go through GMP, whose Lehmer gcd outpaces
+# math.gcd; below it the conversion to mpz costs more than it saves
+_GMP_GCD_MIN_BITS = 128
+
+# With factor_early, find_order tests gcd(a^k - 1, n) once every this many
+# multiplications
+_FACTOR_CHECK_INTERVAL = 16
+
+# Iteration budget for the optional Pollard's rho fast path; enough to pull
+# out prime factors of roughly 40 bits before giving up
+_RHO_MAX_ITERATIONS = 1 << 20
+
+def _iroot(n, k):
+    """
+    Integer k-th root of n.
+    
+    Args:
+        n: A non-negative integer
+        k: The root degree (k >= 1)
+    
+    Returns:
+        A tuple (x, exact) where x = floor(n^(1/k)) and exact is True
+        if x^k == n
+    """
+    if gmpy2 is not None:
+        x, exact = gmpy2.iroot(n, k)
+        return int(x), bool(exact)
+    
+    if n < 2:
+        return n, True
+    
+    # Newton's method on integers, starting from an upper bound so the
+    # iterates decrease monotonically to floor(n^(1/k))
+    x = 1 << ((n.bit_length() + k - 1) // k)
+    while True:
+        y = ((k - 1) * x + n // x ** (k - 1)) // k
+        if y >= x:
+            return x, x ** k == n
+        x = y
+
+_MR_WITNESSES = (2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37, 41)
+
+def _is_prime(n):
+    """
+    Miller-Rabin primality test.
+    
+    Deterministic for n < 3.3 * 10^24 with the fixed witness set, and a
+    strong probable-prime test beyond that.
+    
+    Args:
+        n: The number to test
+    
+    Returns:
+        True if n is (probably) prime, False otherwise
+    """
+    if n < 2:
+        return False
+    for p in _MR_WITNESSES:
+        if n % p == 0:
+            return n == p
+    
+    # Write n - 1 = d * 2^s with d odd
+    d = n - 1
+    s = 0
+    while d % 2 == 0:
+        d //= 2
+        s += 1
+    
+    for a in _MR_WITNESSES:
+        x = pow(a, d, n)
+        if x == 1 or x == n - 1:
+            continue
+        for _ in range(s - 1):
+            x = x * x % n
+            if x == n - 1:
+                break
+        else:
+            return False
+    
+    return True
+
+def _gcd(a, n):
+    """
+    gcd(a, n), computed by GMP when n is large and gmpy2 is installed.
+    """
+    if gmpy2 is not None and n.bit_length() >= _GMP_GCD_MIN_BITS:
+        return int(gmpy2.gcd(a, n))
+    return gcd(a, n)
+
+def _random_bases(n):
+    """
+    Yield random bases a in [2, n), never the same one twice.
+    
+    Args:
+        n: The number being factored
+    
+    Yields:
+        Distinct bases in random order, until all n - 2 are used up
+    """
+    # Lazy Fisher-Yates shuffle of [2, n): only the positions displaced by
+    # earlier swaps are stored, so each draw costs O(1) time and memory
+    swapped = {}
+    for i in range(2, n):
+        j = random.randint(i, n - 1)
+        yield swapped.get(j, j)
+        swapped[j] = swapped.pop(i, i)
+
+def _draw_bases(bases, n, count):
+    """
+    Take the next bases from a _random_bases iterator together with
+    gcd(a, n).
+    
+    Args:
+        bases: Iterator from _random_bases(n)
+        n: The number being factored
+        count: How many bases to take
+    
+    Returns:
+        A list of (a, gcd(a, n)) pairs, empty once every base is used
+    """
+    return [(a, _gcd(a, n)) for a in islice(bases, count)]
+
+def _pollard_rho(n, max_iterations=_RHO_MAX_ITERATIONS):
+    """
+    Pollard's rho factorization with Floyd cycle detection.
+    
+    Args:
+        n: An odd composite number to factor
+        max_iterations: Give up after this many steps
+    
+    Returns:
+        A nontrivial factor of n, or None if none was found in budget
+    """
+    x = y = 2
+    for _ in range(max_iterations):
+        x = (x * x + 1) % n
+        y = (y * y + 1) % n
+        y = (y * y + 1) % n
+        d = _gcd(abs(x - y), n)
+        if d != 1:
+            return d if d != n else None
+    
+    return None
+
+def _pow_mod(a, e, n):
+    """
+    a^e mod n, through GMP for moduli wider than a machine word.
+    """
+    if gmpy2 is not None and n.bit_length() > _MACHINE_WORD_BITS:
+        return int(gmpy2.powmod(a, e, n))
+    return pow(a, e, n)
+
+def find_order(a, n, max_order=None, factor_early=False):
     """
     Find the order r such that a^r ≡ 1 (mod n).
     This is the period-finding step of Shor's algorithm.
     
+    Uses baby-step giant-step with at most _BSGS_MAX_BABY_STEPS baby
+    steps, so memory stays bounded; once max_order outgrows the square of
+    that cap the giant steps, and with them the running time, grow linearly.
+    
     Args:
         a: The base (must satisfy gcd(a, n) = 1)
         n: The modulus
         max_order: Maximum order to check (default: n)
+        factor_early: Periodically check whether gcd(a^k - 1, n) is a
+            nontrivial factor of n and stop as soon as one turns up
     
     Returns:
-        The order r, or None if not found
+        The order r, or None if not found. With factor_early, a tagged
+        tuple ('factor', g) if a factor g of n was found first
     """
     if max_order is None:
         max_order = n
     
+    # Without gcd(a, n) = 1 no power of a is ever ≡ 1 (mod n)
+    if n < 2 or _gcd(a, n) != 1:
+        return None
+    
+    # Small moduli, such as the demo's: walk the powers of a directly
+    if n <= _SMALL_N_MAX:
+        result = 1
+        for r in range(1, max_order + 1):
+            result = (result * a) % n
+            if result == 1:
+                return r
+            if factor_early and r % _FACTOR_CHECK_INTERVAL == 0:
+                g = _gcd(result - 1, n)
+                if g != 1:
+                    return ("factor", g)
+        return None
+    
+    # Baby-step giant-step: O(sqrt(max_order)) multiplications instead of
+    # stepping through every exponent up to max_order. The table is capped,
+    # so for huge max_order it takes more giant steps instead.
+    m = min(math.isqrt(max_order) + 1, _BSGS_MAX_BABY_STEPS)
+    
+    # Baby steps: remember a^j for 0 <= j < m. If a^j ≡ 1 already, the
+    # order is smaller than m and we are done.
+    baby = {}
     result = 1
-    for r in range(1, max_order + 1):
+    for j in range(m):
+        if j > 0 and result == 1:
+            return j if j <= max_order else None
+        if factor_early and j > 0 and j % _FACTOR_CHECK_INTERVAL == 0:
+            g = _gcd(result - 1, n)
+            if g != 1:
+                return ("factor", g)
+        baby[result] = j
         result = (result * a) % n
-        if result == 1:
-            return r
+    
+    # Giant steps: a^(i*m) ≡ a^j gives a^(i*m - j) ≡ 1. Since all baby
+    # steps are distinct, the first match yields the smallest such exponent.
+    giant = result
+    result = 1
+    for i in range(1, -(-max_order // m) + 1):
+        result = (result * giant) % n
+        j = baby.get(result)
+        if j is not None:
+            r = i * m - j
+            return r if r <= max_order else None
+        if factor_early and i % _FACTOR_CHECK_INTERVAL == 0:
+            g = _gcd(result - 1, n)
+            if g != 1:
+                return ("factor", g)
     
     return None
 
-def shors_algorithm(n, verbose=True):
+def shors_algorithm(n, verbose=True, use_rho=False):
     """
     Classical simulation of Shor's factorization algorithm.
     
@@ -36,133 +259,194 @@ def shors_algorithm(n, verbose=True):
     Args:
         n: The number to factor (must be composite and odd)
         verbose: Print detailed steps
+        use_rho: Try Pollard's rho first and only fall back to the Shor
+            flow if it fails within its iteration budget
     
     Returns:
         A tuple of factors (p, q) where n = p * q, or None if unsuccessful
     """
+    # Collect the verbose trace and write it in one go rather than paying
+    # for a print call per line. The trace is written even if the run
+    # raises, so slow runs that fail or are interrupted keep their progress
+    log = []
+    try:
+        return _shors_algorithm(n, verbose, use_rho, log)
+    finally:
+        if log:
+            sys.stdout.write("\n".join(log) + "\n")
+            sys.stdout.flush()
+
+def _shors_algorithm(n, verbose, use_rho, log):
+    """
+    Body of shors_algorithm; verbose output is appended to log.
+    """
     if verbose:
-        print("=" * 70)
-        print("Shor's Algorithm - Classical Simulation")
-        print("=" * 70)
-        print(f"Factoring: {n}\n")
+        log.append("=" * 70)
+        log.append("Shor's Algorithm - Classical Simulation")
+        log.append("=" * 70)
+        log.append(f"Factoring: {n}\n")
     
     # Step 1: Check if n is even
     if n % 2 == 0:
         if verbose:
-            print("✓ Number is even")
-            print(f"  Factors: 2 × {n // 2}")
+            log.append("✓ Number is even")
+            log.append(f"  Factors: 2 × {n // 2}")
         return (2, n // 2)
     
+    # A prime has no factors to find; without this check the retry loop
+    # below would try every base before giving up
+    if _is_prime(n):
+        if verbose:
+            log.append(f"✗ {n} is prime, nothing to factor")
+        return None
+    
     if verbose:
-        print("Step 1: Check if n is a perfect power")
+        log.append("Step 1: Check if n is a perfect power")
     
     # Step 2: Check if n is a perfect power
-    for k in range(2, int(math.log2(n)) + 1):
-        a = round(n ** (1 / k))
-        if a ** k == n:
+    for k in range(2, n.bit_length()):
+        a, exact = _iroot(n, k)
+        if exact:
             if verbose:
-                print(f"✓ {n} = {a}^{k}")
-                print(f"  Factors: {a} × {a**(k-1)}")
+                log.append(f"✓ {n} = {a}^{k}")
+                log.append(f"  Factors: {a} × {a**(k-1)}")
             return (a, a ** (k - 1))
     
     if verbose:
-        print("✗ Not a perfect power\n")
-        print("Step 2: Find a random number a where gcd(a, n) = 1")
+        log.append("✗ Not a perfect power\n")
     
-    # Step 3: Pick a random number a < n
-    max_attempts = 10
-    for attempt in range(max_attempts):
-        a = random.randint(2, n - 1)
-        
-        # Step 4: Compute gcd(a, n)
-        g = gcd(a, n)
-        
+    # Optional classical fast path: Pollard's rho runs in O(n^(1/4)) and
+    # beats the simulated period search by orders of magnitude
+    if use_rho:
         if verbose:
-            print(f"  Attempt {attempt + 1}: a = {a}, gcd({a}, {n}) = {g}")
-        
-        if g != 1:
-            # We found a factor!
+            log.append("Fast path: Pollard's rho")
+        d = _pollard_rho(n)
+        if d is not None:
             if verbose:
-                print(f"✓ Found factor: {g}")
-                print(f"  {n} = {g} × {n // g}")
-            return (g, n // g)
-    
-    if verbose:
-        print("✗ Could not find factor via gcd\n")
-        print("Step 3: Find the period r (order of a modulo n)")
-    
-    # Step 5: Find the order of a modulo n (period-finding step)
-    # In a quantum computer, this would use Quantum Phase Estimation
-    # Here we do it classically
-    r = find_order(a, n)
-    
-    if r is None:
+                log.append(f"✓ Found factor: {d}")
+                log.append(f"  {n} = {d} × {n // d}")
+            return (d, n // d)
         if verbose:
-            print("✗ Could not find order")
-        return None
-    
-    if verbose:
-        print(f"✓ Found order: {a}^{r} ≡ 1 (mod {n})\n")
-        print(f"Step 4: Use the period to find factors")
-        print(f"  a = {a}, r = {r}")
+            log.append("✗ Pollard's rho gave up, falling back to Shor\n")
     
-    # Step 6: If r is odd, try again
-    if r % 2 == 1:
-        if verbose:
-            print(f"✗ Order {r} is odd, trying another a...\n")
-        return shors_algorithm(n, verbose=False)
-    
-    if verbose:
-        print(f"✓ Order is even: r = {r}\n")
-        print(f"Step 5: Compute a^(r/2) mod n")
-    
-    # Step 7: Compute x = a^(r/2) mod n
-    x = pow(a, r // 2, n)
-    if verbose:
-        print(f"  {a}^({r}//2) ≡ {x} (mod {n})\n")
-        print(f"Step 6: Check if x ≡ ±1 (mod n)")
-    
-    # Step 8: Check if x ≡ -1 (mod n)
-    if x == n - 1:
-        if verbose:
-            print(f"✗ {x} ≡ -1 (mod {n}), trying another a...\n")
-        return shors_algorithm(n, verbose=False)
-    
-    if verbose:
-        print(f"✓ {x} is not ±1 mod {n}\n")
-        print(f"Step 7: Find factors using gcd")
-    
-    # Step 9: Compute gcd(x ± 1, n)
-    factor1 = gcd(x - 1, n)
-    factor2 = gcd(x + 1, n)
-    
-    if verbose:
-        print(f"  gcd({x} - 1, {n}) = {factor1}")
-        print(f"  gcd({x} + 1, {n}) = {factor2}\n")
-    
-    # Step 10: Check if we found nontrivial factors
-    if factor1 > 1 and factor1 < n:
+    # Steps 1-2 are deterministic, so on failure only the random choice of
+    # a and the period search below are repeated.
+    max_attempts = 10
+    bases = _random_bases(n)
+    while True:
         if verbose:
-            print("=" * 70)
-            print(f"✓ Successfully factored {n}:")
-            print(f"  {n} = {factor1} × {n // factor1}")
-            print(f"  Verification: {factor1} × {n // factor1} = {factor1 * (n // factor1)}")
-            print("=" * 70)
-        return (factor1, n // factor1)
-    
-    if factor2 > 1 and factor2 < n:
+            log.append("Step 2: Find a random number a where gcd(a, n) = 1")
+        
+        # Step 3: Pick a random number a < n
+        # Step 4: Compute gcd(a, n) for the whole batch, keeping every
+        # coprime base for the period search below
+        batch = _draw_bases(bases, n, max_attempts)
+        if not batch:
+            if verbose:
+                log.append("✗ Every base has been tried")
+            return None
+        
+        coprimes = []
+        for attempt, (a, g) in enumerate(batch):
+            if verbose:
+                log.append(f"  Attempt {attempt + 1}: a = {a}, gcd({a}, {n}) = {g}")
+            
+            if g != 1:
+                # We found a factor!
+                if verbose:
+                    log.append(f"✓ Found factor: {g}")
+                    log.append(f"  {n} = {g} × {n // g}")
+                return (g, n // g)
+            
+            coprimes.append(a)
+        
         if verbose:
-            print("=" * 70)
-            print(f"✓ Successfully factored {n}:")
-            print(f"  {n} = {factor2} × {n // factor2}")
-            print(f"  Verification: {factor2} × {n // factor2} = {factor2 * (n // factor2)}")
-            print("=" * 70)
-        return (factor2, n // factor2)
-    
-    if verbose:
-        print("✗ Could not find nontrivial factors, trying another a...\n")
-    
-    return shors_algorithm(n, verbose=False)
+            log.append("✗ Could not find factor via gcd\n")
+        
+        # Try the period search on each coprime base in turn before
+        # drawing a new batch
+        for a in coprimes:
+            if verbose:
+                log.append(f"Step 3: Find the period r (order of {a} modulo n)")
+            
+            # Step 5: Find the order of a modulo n (period-finding step)
+            # In a quantum computer, this would use Quantum Phase Estimation
+            # Here we do it classically
+            r = find_order(a, n, factor_early=True)
+            
+            if r is None:
+                if verbose:
+                    log.append("✗ Could not find order")
+                return None
+            
+            # The search may have stumbled on a factor before reaching r
+            if isinstance(r, tuple):
+                _, g = r
+                if verbose:
+                    log.append(f"✓ Found factor while searching for the period: {g}")
+                    log.append(f"  {n} = {g} × {n // g}")
+                return (g, n // g)
+            
+            if verbose:
+                log.append(f"✓ Found order: {a}^{r} ≡ 1 (mod {n})\n")
+                log.append(f"Step 4: Use the period to find factors")
+                log.append(f"  a = {a}, r = {r}")
+            
+            # Step 6: If r is odd, try again
+            if r % 2 == 1:
+                if verbose:
+                    log.append(f"✗ Order {r} is odd, trying another a...\n")
+                continue
+            
+            if verbose:
+                log.append(f"✓ Order is even: r = {r}\n")
+                log.append(f"Step 5: Compute a^(r/2) mod n")
+            
+            # Step 7: Compute x = a^(r/2) mod n
+            x = _pow_mod(a, r // 2, n)
+            if verbose:
+                log.append(f"  {a}^({r}//2) ≡ {x} (mod {n})\n")
+                log.append(f"Step 6: Check if x ≡ ±1 (mod n)")
+            
+            # Step 8: Check if x ≡ -1 (mod n)
+            if x == n - 1:
+                if verbose:
+                    log.append(f"✗ {x} ≡ -1 (mod {n}), trying another a...\n")
+                continue
+            
+            if verbose:
+                log.append(f"✓ {x} is not ±1 mod {n}\n")
+                log.append(f"Step 7: Find factors using gcd")
+            
+            # Step 9: Compute gcd(x ± 1, n)
+            factor1 = _gcd(x - 1, n)
+            factor2 = _gcd(x + 1, n)
+            
+            if verbose:
+                log.append(f"  gcd({x} - 1, {n}) = {factor1}")
+                log.append(f"  gcd({x} + 1, {n}) = {factor2}\n")
+            
+            # Step 10: Check if we found nontrivial factors
+            if factor1 > 1 and factor1 < n:
+                if verbose:
+                    log.append("=" * 70)
+                    log.append(f"✓ Successfully factored {n}:")
+                    log.append(f"  {n} = {factor1} × {n // factor1}")
+                    log.append(f"  Verification: {factor1} × {n // factor1} = {factor1 * (n // factor1)}")
+                    log.append("=" * 70)
+                return (factor1, n // factor1)
+            
+            if factor2 > 1 and factor2 < n:
+                if verbose:
+                    log.append("=" * 70)
+                    log.append(f"✓ Successfully factored {n}:")
+                    log.append(f"  {n} = {factor2} × {n // factor2}")
+                    log.append(f"  Verification: {factor2} × {n // factor2} = {factor2 * (n // factor2)}")
+                    log.append("=" * 70)
+                return (factor2, n // factor2)
+            
+            if verbose:
+                log.append("✗ Could not find nontrivial factors, trying another a...\n")
 
 def main():
     """